@@ -1,4 +1,5 @@
 """ Contains Batch classes for images """
+import io
 import os
 import warnings
 from numbers import Number
@@ -11,12 +12,64 @@ import PIL.ImageFilter
 import PIL.ImageEnhance
 from scipy.ndimage.filters import gaussian_filter
 from scipy.ndimage.interpolation import map_coordinates
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    from .decorators import njit
+    NUMBA_AVAILABLE = False
 
 from .batch import Batch
 from .decorators import action, apply_parallel, inbatch_parallel
 from .dsindex import FilesIndex
 
 
+@njit(nogil=True, cache=True)
+def stamp_salt(image, rows, cols, sizes, colors):
+    """ Fill rectangles of `sizes` with top left corners at (`rows`, `cols`) by `colors` inplace.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Array of (height, width, channels) shape.
+    rows, cols : np.ndarray
+        Coordinates of top left corners.
+    sizes : np.ndarray
+        Array of (n, 2) shape with sizes of rectangles along rows and columns.
+    colors : np.ndarray
+        Array of (n, channels) shape with colors of rectangles.
+    """
+    height, width = image.shape[0], image.shape[1]
+    # Rectangles are filled sequentially, so that the later ones overwrite the earlier, as with slice assignments
+    for i in range(rows.size):
+        for row in range(rows[i], min(rows[i] + sizes[i, 0], height)):
+            for col in range(cols[i], min(cols[i] + sizes[i, 1], width)):
+                image[row, col] = colors[i]
+    return image
+
+
+# Dtypes of images and results `affine_clip` is used for: others, e.g. `np.float16`, are processed by NumPy
+AFFINE_CLIP_DTYPES = (np.uint8, np.float32, np.float64)
+
+@njit(nogil=True, cache=True)
+def affine_clip(image, scale, bias, low, high, out):
+    """ Compute `scale * image + bias`, clip it to [`low`, `high`] and cast to `out` dtype in a single pass.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Source array.
+    scale, bias, low, high : number
+        Parameters of the transform. Infinite bounds disable clipping.
+    out : np.ndarray
+        Contiguous array of the same shape as `image` to write results to.
+    """
+    image_flat, out_flat = image.ravel(), out.reshape(-1)
+    for i in range(image_flat.size):
+        out_flat[i] = min(max(scale * image_flat[i] + bias, low), high)
+    return out
+
+
 class BaseImagesBatch(Batch):
     """ Batch class for 2D images.
 
@@ -183,12 +236,17 @@ class ImagesBatch(BaseImagesBatch):
     @property
     def image_shape(self):
         """: tuple - shape of the image"""
-        _, shapes_count = np.unique([image.size for image in self.images], return_counts=True, axis=0)
-        if len(shapes_count) == 1:
-            if isinstance(self.images[0], PIL.Image.Image):
-                return (*self.images[0].size, len(self.images[0].getbands()))
-            return self.images[0].shape
-        raise RuntimeError('Images have different shapes')
+        images = self.images
+        if isinstance(images, np.ndarray) and images.dtype != object:
+            # Stacked array: all images share the shape by construction
+            return images.shape[1:]
+
+        first = images[0]
+        if any(image.size != first.size for image in images[1:]):
+            raise RuntimeError('Images have different shapes')
+        if isinstance(first, PIL.Image.Image):
+            return (*first.size, len(first.getbands()))
+        return first.shape
 
     @inbatch_parallel(init='indices', post='_assemble')
     def _load_image(self, ix, src=None, fmt=None, dst="images"):
@@ -205,7 +263,13 @@ class ImagesBatch(BaseImagesBatch):
         fmt : str
             Format of an image.
         """
-        return PIL.Image.open(self._make_path(ix, src))
+        # File is read with a single call and closed right away
+        with open(self._make_path(ix, src), 'rb') as file:
+            image = PIL.Image.open(io.BytesIO(file.read()))
+        # Decoding is forced here: PIL releases GIL while decoding, so images are decoded by worker threads
+        # in parallel instead of one by one at the first (sequential) transform
+        image.load()
+        return image
 
     @inbatch_parallel(init='indices')
     def _dump_image(self, ix, src='images', dst=None, fmt=None):
@@ -239,15 +303,19 @@ class ImagesBatch(BaseImagesBatch):
             component to assemble
         """
         _ = args, kwargs
-        if isinstance(result[0], PIL.Image.Image):
-            setattr(self, component, np.asarray(result, dtype=object))
-        else:
+        if not isinstance(result[0], PIL.Image.Image):
             try:
                 setattr(self, component, np.stack(result))
+                return
             except ValueError:
-                array_result = np.empty(len(result), dtype=object)
-                array_result[:] = result
-                setattr(self, component, array_result)
+                pass
+
+        # Items are put into a preallocated array one by one, so that numpy does not look into
+        # their content: PIL images expose array interface, and ragged arrays can't be broadcasted
+        array_result = np.empty(len(result), dtype=object)
+        for i, item in enumerate(result):
+            array_result[i] = item
+        setattr(self, component, array_result)
 
     @apply_parallel
     def to_pil(self, image, mode=None):
@@ -328,8 +396,8 @@ class ImagesBatch(BaseImagesBatch):
             elif origin == 'center':
                 origin = np.maximum(0, np.asarray(background_shape) - image_shape) // 2
             elif origin == 'random':
-                origin = (np.random.randint(background_shape[0]-image_shape[0]+1),
-                          np.random.randint(background_shape[1]-image_shape[1]+1))
+                # Both coordinates are sampled with a single call
+                origin = np.random.randint(np.asarray(background_shape[:2]) - np.asarray(image_shape[:2]) + 1)
             else:
                 msg = "If string, origin should be one of ['center', 'top_left', 'top_right', "\
                       f"'bottom_left', 'bottom_right', 'random']. Got '{origin}'."
@@ -343,7 +411,7 @@ class ImagesBatch(BaseImagesBatch):
                   f"sequence of floats in [0, 1) interval. Got {origin}"
             raise ValueError(msg)
 
-        return np.asarray(origin, dtype=np.int)
+        return np.asarray(origin, dtype=np.int64)
 
     @apply_parallel
     def scale(self, image, factor, preserve_shape=False, origin='center', resample=0):
@@ -406,6 +474,9 @@ class ImagesBatch(BaseImagesBatch):
         self
         """
         original_shape = self._get_image_shape(image)
+        if np.all(np.asarray(factor) == 1):
+            # Both resizing and preserving shape would just copy the image
+            return image
         rescaled_shape = list(np.int32(np.ceil(np.asarray(original_shape)*factor)))
         rescaled_image = image.resize(rescaled_shape, resample=resample)
         if preserve_shape:
@@ -523,12 +594,12 @@ class ImagesBatch(BaseImagesBatch):
         """
         transformed_shape = self._get_image_shape(transformed_image)
         if np.any(np.array(transformed_shape) < np.array(original_shape)):
-            n_channels = len(transformed_image.getbands())
-            if n_channels == 1:
-                background = np.zeros(original_shape, dtype=np.uint8)
-            else:
-                background = np.zeros((*original_shape, n_channels), dtype=np.uint8)
-            return self._put_on_background_(transformed_image, background, origin)
+            # Zero-filled background is created directly by PIL and is pasted into in place:
+            # no intermediate array, conversion or defensive copy is needed, as it is not shared
+            background = PIL.Image.new(transformed_image.mode, tuple(original_shape))
+            origin = list(self._calc_origin(transformed_shape, origin, original_shape))
+            background.paste(transformed_image, origin)
+            return background
         return self._crop_(transformed_image, origin, original_shape, True)
 
     @apply_parallel
@@ -715,13 +786,36 @@ class ImagesBatch(BaseImagesBatch):
         if channels == 'all':
             image = PIL.ImageChops.invert(image)
         else:
-            bands = list(image.split())
+            # Per-band lookup table inverts chosen channels in a single pass without splitting the image
+            n_bands = len(image.getbands())
             channels = (channels,) if isinstance(channels, Number) else channels
-            for channel in channels:
-                bands[channel] = PIL.ImageChops.invert(bands[channel])
-            image = PIL.Image.merge('RGB', bands)
+            channels = {channel % n_bands for channel in channels}
+            lut = [255 - value if band in channels else value for band in range(n_bands) for value in range(256)]
+            image = image.point(lut)
         return image
 
+    @staticmethod
+    def _sample_salt(shape, p_noise):
+        """ Sample positions of pixels, each chosen independently with probability `p_noise`.
+
+        The number of chosen pixels is sampled first, and then only that many distinct positions are drawn.
+        For sparse noise this avoids creating and scanning the mask of the whole image.
+
+        Returns
+        -------
+        tuple of two np.ndarrays : rows and columns of chosen pixels in row-major order.
+        """
+        n_pixels = int(np.prod(shape))
+        if p_noise >= .5:
+            return np.where(np.random.binomial(1, p_noise, size=shape).astype(bool))
+
+        n_salt = np.random.binomial(n_pixels, p_noise)
+        positions = np.unique(np.random.randint(n_pixels, size=n_salt))
+        while positions.size < n_salt:
+            extra = np.random.randint(n_pixels, size=n_salt - positions.size)
+            positions = np.unique(np.concatenate([positions, extra]))
+        return np.unravel_index(positions, shape)
+
     @apply_parallel
     def salt(self, image, p_noise=.015, color=255, size=(1, 1)):
         """ Set random pixel on image to givan value.
@@ -750,21 +844,27 @@ class ImagesBatch(BaseImagesBatch):
         p : float
             Probability of applying the transform. Default is 1.
         """
-        mask_size = np.asarray(self._get_image_shape(image))
-        mask_salt = np.random.binomial(1, p_noise, size=mask_size).astype(bool)
         image = np.array(image)
+        rows, cols = self._sample_salt(image.shape[:2], p_noise)
         if isinstance(size, (tuple, int)) and size in [1, (1, 1)] and not callable(color):
-            image[mask_salt] = color
+            image[rows, cols] = color
         else:
             size_lambda = size if callable(size) else lambda: size
             color_lambda = color if callable(color) else lambda: color
-            mask_salt = np.where(mask_salt)
-            for i in range(len(mask_salt[0])):
-                current_size = size_lambda()
-                current_size = (current_size, current_size) if isinstance(current_size, Number) else current_size
-                left_top = np.asarray((mask_salt[0][i], mask_salt[1][i]))
-                right_bottom = np.minimum(left_top + current_size, self._get_image_shape(image))
-                image[left_top[0]:right_bottom[0], left_top[1]:right_bottom[1]] = color_lambda()
+            if rows.size > 0:
+                # Sizes and colors are sampled upfront, so that only the stamping itself is done per pixel
+                sizes = [size_lambda() for _ in range(rows.size)]
+                sizes = np.array([(item, item) if isinstance(item, Number) else item for item in sizes],
+                                 dtype=np.int64)
+                channels = image.reshape(*image.shape[:2], -1)
+                colors = np.array([color_lambda() for _ in range(rows.size)], dtype=image.dtype)
+                colors = np.ascontiguousarray(np.broadcast_to(colors.reshape(rows.size, -1),
+                                                              (rows.size, channels.shape[-1])))
+                if NUMBA_AVAILABLE:
+                    stamp_salt(channels, rows, cols, sizes, colors)
+                else:
+                    for row, col, (height, width), value in zip(rows, cols, sizes, colors):
+                        channels[row:row + height, col:col + width] = value
 
         return PIL.Image.fromarray(image)
 
@@ -787,14 +887,15 @@ class ImagesBatch(BaseImagesBatch):
         p : float
             Probability of applying the transform. Default is 1.
         """
+        n_bands = len(image.getbands())
         if isinstance(low, Number):
-            low = tuple([low]*3)
+            low = tuple([low]*n_bands)
         if isinstance(high, Number):
-            high = tuple([high]*3)
+            high = tuple([high]*n_bands)
 
-        high = PIL.Image.new('RGB', image.size, high)
-        low = PIL.Image.new('RGB', image.size, low)
-        return PIL.ImageChops.lighter(PIL.ImageChops.darker(image, high), low)
+        # Per-band lookup table is applied in a single pass without full-size images for bounds
+        lut = [int(max(min(value, upper), lower)) for lower, upper in zip(low, high) for value in range(256)]
+        return image.point(lut)
 
     @apply_parallel
     def enhance(self, image, layout='hcbs', factor=(1, 1, 1, 1)):
@@ -843,7 +944,8 @@ class ImagesBatch(BaseImagesBatch):
             whether to force image's pixels to be in [0, 255] or [0, 1.]
         preserve_type : bool
             Whether to preserve ``dtype`` of transformed images.
-            If ``False`` is given then the resulting type will be ``np.float``.
+            If ``False`` is given then the resulting type will be ``np.float32``,
+            or ``np.float64`` for images that need higher precision (e.g. ``np.float64`` ones).
         src : str
             Component to get images from. Default is 'images'.
         dst : str
@@ -859,13 +961,19 @@ class ImagesBatch(BaseImagesBatch):
                 warnings.warn("Note that some info might be lost during `multiply` transformation since PIL.image "
                               "stores data as `np.uint8`. To suppress this warning, use `preserve_type=True` or "
                               "consider using `to_array` action before multiplication.")
-            return PIL.Image.fromarray(np.clip(multiplier*np.asarray(image), 0, 255).astype(np.uint8))
-        dtype = image.dtype if preserve_type else np.float
+            image = multiplier * np.asarray(image)
+            return PIL.Image.fromarray(np.clip(image, 0, 255, out=image).astype(np.uint8))
+        # Single precision halves memory traffic of the transform; it is exact for 8- and 16-bit images
+        dtype = image.dtype if preserve_type else np.result_type(image.dtype, np.float32)
+        fused = NUMBA_AVAILABLE and image.dtype in AFFINE_CLIP_DTYPES and dtype in AFFINE_CLIP_DTYPES
+        if fused and multiplier.ndim == 0:
+            low, high = (0, 255 if dtype == np.uint8 else 1.) if clip else (-np.inf, np.inf)
+            return affine_clip(image, multiplier, 0., low, high, np.empty(image.shape, dtype=dtype))
+        # Product is a new array, so clipping and casting are done without additional temporaries
+        image = multiplier * image
         if clip:
-            image = np.clip(multiplier*image, 0, 255 if dtype == np.uint8 else 1.)
-        else:
-            image = multiplier * image
-        return image.astype(dtype)
+            np.clip(image, 0, 255 if dtype == np.uint8 else 1., out=image)
+        return image.astype(dtype, copy=False)
 
     @apply_parallel
     def add(self, image, term=1., clip=False, preserve_type=False):
@@ -878,7 +986,8 @@ class ImagesBatch(BaseImagesBatch):
             whether to force image's pixels to be in [0, 255] or [0, 1.]
         preserve_type : bool
             Whether to preserve ``dtype`` of transformed images.
-            If ``False`` is given then the resulting type will be ``np.float``.
+            If ``False`` is given then the resulting type will be ``np.float32``,
+            or ``np.float64`` for images that need higher precision (e.g. ``np.float64`` ones).
         src : str
             Component to get images from. Default is 'images'.
         dst : str
@@ -888,13 +997,20 @@ class ImagesBatch(BaseImagesBatch):
         """
         term = np.float32(term)
         if isinstance(image, PIL.Image.Image):
-            return PIL.Image.fromarray(np.clip(term+np.asarray(image), 0, 255).astype(np.uint8))
-        dtype = image.dtype if preserve_type else np.float
+            image = term + np.asarray(image)
+            return PIL.Image.fromarray(np.clip(image, 0, 255, out=image).astype(np.uint8))
+        dtype = image.dtype if preserve_type else np.result_type(image.dtype, np.float32)
+        fused = NUMBA_AVAILABLE and image.dtype in AFFINE_CLIP_DTYPES and dtype in AFFINE_CLIP_DTYPES
+        if fused and term.ndim == 0:
+            if clip and image.dtype == dtype == np.uint8 and float(term).is_integer():
+                # Saturating integer addition: kernel is specialized for integer arguments, no floats are involved
+                return affine_clip(image, 1, int(term), 0, 255, np.empty(image.shape, dtype=dtype))
+            low, high = (0, 255 if dtype == np.uint8 else 1.) if clip else (-np.inf, np.inf)
+            return affine_clip(image, 1., term, low, high, np.empty(image.shape, dtype=dtype))
+        image = term + image
         if clip:
-            image = np.clip(term+image, 0, 255 if dtype == np.uint8 else 1.)
-        else:
-            image = term + image
-        return image.astype(dtype)
+            np.clip(image, 0, 255 if dtype == np.uint8 else 1., out=image)
+        return image.astype(dtype, copy=False)
 
     @apply_parallel
     def pil_convert(self, image, mode="L"):
@@ -1051,7 +1167,8 @@ class ImagesBatch(BaseImagesBatch):
             whether to force image's pixels to be in [0, 255] or [0, 1.]
         preserve_type : bool
             Whether to preserve ``dtype`` of transformed images.
-            If ``False`` is given then the resulting type will be ``np.float``.
+            If ``False`` is given then the resulting type will be ``np.float32``,
+            or ``np.float64`` for images that need higher precision (e.g. ``np.float64`` ones).
         src : str
             Component to get images from. Default is 'images'.
         dst : str
@@ -1074,7 +1191,8 @@ class ImagesBatch(BaseImagesBatch):
             whether to force image's pixels to be in [0, 255] or [0, 1.]
         preserve_type : bool
             Whether to preserve ``dtype`` of transformed images.
-            If ``False`` is given then the resulting type will be ``np.float``.
+            If ``False`` is given then the resulting type will be ``np.float32``,
+            or ``np.float64`` for images that need higher precision (e.g. ``np.float64`` ones).
         src : str
             Component to get images from. Default is 'images'.
         dst : str
@@ -460,9 +460,9 @@ def parallel(*args, use_self=None, **kwargs):
     return inbatch_parallel(*args, _use_self=use_self, **kwargs)
 
 
-def njit(nogil=True, parallel=True):  # pylint: disable=redefined-outer-name
+def njit(nogil=True, parallel=True, **kwargs):  # pylint: disable=redefined-outer-name
     """ Fake njit decorator to use when numba is not installed """
-    _, _ = nogil, parallel
+    _, _, _ = nogil, parallel, kwargs
     def njit_fake_decorator(method):
         """ Return a decorator """
         @functools.wraps(method)
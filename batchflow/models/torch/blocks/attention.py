@@ -92,6 +92,17 @@ class SCSEBlock(nn.Module):
 
 
 
+class PointwiseLinear(nn.Module):
+    """ Apply linear layer along the channels axis: equivalent of a 1x1 convolution. """
+    def __init__(self, layer):
+        super().__init__()
+        self.layer = layer
+
+    def forward(self, x):
+        return self.layer(x.movedim(1, -1)).movedim(-1, 1)
+
+
+
 class SimpleSelfAttention(nn.Module):
     """ Improved self Attention module.
 
@@ -106,15 +117,20 @@ class SimpleSelfAttention(nn.Module):
         Kernel size.
     layout : str
         Layout for convolution layers.
+
+    Notes
+    -----
+    For CPU inference, pointwise projections can be quantized to int8 by an explicit call of :meth:`.to_int8`.
     """
     def __init__(self, inputs=None, layout='cna', kernel_size=1, ratio=8, **kwargs):
         super().__init__()
-        self.gamma = nn.Parameter(torch.zeros(1, device=inputs.device))
+        self.gamma = nn.Parameter(torch.zeros(1))
 
+        # All three branches are computed by one layer: its output is split along channels in `forward`
+        in_channels = get_num_channels(inputs)
+        self.split_sizes = [in_channels // ratio, in_channels // ratio, in_channels]
         args = {**kwargs, **dict(inputs=inputs, layout=layout, kernel_size=kernel_size)}
-        self.top_branch = Block(**args, channels=f'same//{ratio}')
-        self.mid_branch = Block(**args, channels=f'same//{ratio}')
-        self.bot_branch = Block(**args, channels='same')
+        self.branches = Block(**args, channels=sum(self.split_sizes))
 
         self.desc_kwargs = {
             'class': self.__class__.__name__,
@@ -123,17 +139,71 @@ class SimpleSelfAttention(nn.Module):
             'ratio': ratio,
         }
 
+    LEGACY_BRANCHES = ('top_branch', 'mid_branch', 'bot_branch')
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        """ Convert weights of separate `top_branch`, `mid_branch` and `bot_branch` blocks, saved by previous
+        versions of the module, into the weights of the fused `branches` block.
+        All parameters and buffers of the branches are per-channel, so they are concatenated along the first axis;
+        scalar buffers, e.g. `num_batches_tracked` of normalization layers, are taken from the first branch.
+        """
+        top_prefix = prefix + self.LEGACY_BRANCHES[0] + '.'
+        for key in [key for key in state_dict if key.startswith(top_prefix)]:
+            suffix = key[len(top_prefix):]
+            tensors = [state_dict.pop(prefix + branch + '.' + suffix) for branch in self.LEGACY_BRANCHES]
+            fused = tensors[0] if tensors[0].ndim == 0 else torch.cat(tensors, dim=0)
+            state_dict[prefix + 'branches.' + suffix] = fused
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def forward(self, x):
         batch_size, spatial = x.shape[0], x.shape[2:]
         num_features = np.prod(spatial)
 
-        phi = self.mid_branch(x).reshape(batch_size, -1, num_features) # (B, C/8, N)
-        theta = self.bot_branch(x).reshape(batch_size, num_features, -1) # (B, N, C)
-        attention = torch.bmm(phi, theta) / num_features # (B, C/8, C)
+        top, mid, bot = torch.split(self.branches(x), self.split_sizes, dim=1)
 
-        out = self.top_branch(x).reshape(batch_size, num_features, -1) # (B, N, C/8)
-        out = torch.bmm(out, attention).reshape(batch_size, -1, *spatial)
-        return self.gamma*out + x
+        phi = mid.reshape(batch_size, -1, num_features) # (B, C/8, N)
+        theta = bot.reshape(batch_size, num_features, -1) # (B, N, C)
+        out = top.reshape(batch_size, num_features, -1) # (B, N, C/8)
+
+        # Order of multiplications with the least number of operations:
+        # `out @ (phi @ theta)` costs 2*N*C/8*C, while `(out @ phi) @ theta` costs N*N*(C/8 + C)
+        reduced_channels, channels = self.split_sizes[1:]
+        if num_features * (reduced_channels + channels) < 2 * reduced_channels * channels:
+            out = torch.bmm(torch.bmm(out, phi), theta) # (B, N, N) @ (B, N, C)
+        else:
+            attention = torch.bmm(phi, theta) # (B, C/8, C)
+            out = torch.bmm(out, attention) # (B, N, C/8) @ (B, C/8, C)
+        out = out.reshape(batch_size, -1, *spatial)
+
+        # Normalization by the number of features is applied to the scalar `gamma`, not to the `attention` matrix
+        return (self.gamma / num_features) * out + x
+
+    def to_int8(self):
+        """ Quantize pointwise convolutions of projections to int8 for CPU inference.
+        As dynamic quantization supports only linear layers, each 1x1 convolution is replaced with the equivalent
+        linear layer along channels, which is then quantized by `torch.ao.quantization.quantize_dynamic`.
+        Matrix multiplications of the attention itself are left as is: int8 kernels for them may be slower.
+        Conversion is done inplace and can't be reverted: quantized module can be used for CPU inference only,
+        so it is better to apply it to a copy of the trained module.
+        """
+        #pylint: disable=import-outside-toplevel
+        from torch.ao.quantization import quantize_dynamic
+
+        for module in list(self.branches.modules()):
+            for name, child in list(module.named_children()):
+                # With unit kernel and stride, both 'same' and 'valid' string paddings mean no padding
+                is_pointwise = (isinstance(child, (nn.Conv1d, nn.Conv2d, nn.Conv3d)) and child.groups == 1
+                                and set(child.kernel_size) == {1} and set(child.stride) == {1}
+                                and (isinstance(child.padding, str) or set(child.padding) == {0}))
+                if is_pointwise:
+                    linear = nn.Linear(child.in_channels, child.out_channels, bias=child.bias is not None)
+                    with torch.no_grad():
+                        linear.weight.copy_(child.weight.flatten(1))
+                        if child.bias is not None:
+                            linear.bias.copy_(child.bias)
+                    linear = quantize_dynamic(nn.Sequential(linear), {nn.Linear}, dtype=torch.qint8)[0]
+                    setattr(module, name, PointwiseLinear(linear))
+        return self
 
     def __repr__(self):
         if getattr(self, 'debug', False):
@@ -330,10 +400,22 @@ class FPA(nn.Module):
         If True, then the convolutions with bigger kernels in the pyramid block are replaced by top one
         with corresponding dilation, i.e. 5x5 -> 3x3 with dilation=2, 7x7 -> 3x3 with dilation=3.
         If False, the dilated convolutions are not used. Default is False.
+    use_compile : bool or dict
+        If True, then module is compiled with `torch.compile`, specialized for the shape of `inputs`.
+        Its many small convolutions are fused and the per-layer Python dispatch is removed.
+        If dict, then it is used as keyword arguments for compilation, e.g. `{'mode': 'reduce-overhead'}`.
+        Requires torch>=2.2. Default is False.
+    autocast_dtype : torch.dtype, 'auto' or None
+        Dtype for the convolutions of both attention and pyramid branches.
+        If 'auto', then `torch.bfloat16` is used on CUDA devices with compute capability 8.0 and higher.
+        If None, then computations are done in the dtype of inputs. Inputs in `float64` are never autocasted.
+        Outputs of branches are summed in `float32` and cast back to the dtype of inputs.
     """
     def __init__(self, inputs=None, pyramid_kernel_size=(7, 5, 3), bottleneck=False, layout='cna',
-                 downsample_layout='p', upsample_layout='t', factor=2, use_dilation=False, **kwargs):
+                 downsample_layout='p', upsample_layout='t', factor=2, use_dilation=False, use_compile=False,
+                 autocast_dtype=None, **kwargs):
         super().__init__()
+        self.autocast_dtype = autocast_dtype
         depth = len(pyramid_kernel_size)
         spatial_shape = get_shape(inputs)[2:]
         num_dims = get_num_dims(inputs)
@@ -380,6 +462,12 @@ class FPA(nn.Module):
         else:
             self.pyramid = Block(pyramid_args, inputs=inputs, **kwargs)
 
+        if use_compile:
+            if not hasattr(nn.Module, 'compile'):
+                raise ImportError(f'`use_compile` of FPA requires torch>=2.2, got {torch.__version__}')
+            compile_kwargs = {'dynamic': False, **(use_compile if isinstance(use_compile, dict) else {})}
+            self.compile(**compile_kwargs)
+
         self.desc_kwargs = {
             'class': self.__class__.__name__,
             'pyramid_kernel_size': pyramid_kernel_size,
@@ -389,9 +477,26 @@ class FPA(nn.Module):
         }
 
     def forward(self, x):
-        attention = self.attention(x)
-        main = self.pyramid(x)
-        return attention + main
+        autocast_dtype = self.get_autocast_dtype(x)
+        if autocast_dtype is None:
+            attention = self.attention(x)
+            main = self.pyramid(x)
+            return attention + main
+
+        with torch.autocast(device_type=x.device.type, dtype=autocast_dtype):
+            attention = self.attention(x)
+            main = self.pyramid(x)
+        return (attention.float() + main.float()).to(x.dtype)
+
+    def get_autocast_dtype(self, x):
+        """ Select dtype for autocasting the branches on inputs `x`. """
+        if x.dtype == torch.float64:
+            return None
+        if self.autocast_dtype == 'auto':
+            if x.is_cuda and torch.cuda.get_device_capability(x.device)[0] >= 8:
+                return torch.bfloat16
+            return None
+        return self.autocast_dtype
 
     def __repr__(self):
         if getattr(self, 'debug', False):
@@ -1,5 +1,7 @@
 """ Functional modules for various deep network architectures."""
-import numpy as np
+from functools import lru_cache
+
+import torch
 from torch import nn
 
 from .core import Block
@@ -7,7 +9,102 @@ from ..layers import Conv, Normalization, Combine
 from ..utils import get_shape, get_num_dims, get_num_channels
 
 
-class PyramidPooling(nn.Module):
+
+def concat_into(x, levels, num_channels, channel_slices, combine):
+    """ Concatenate `levels` along channels into a tensor in the memory format of `x`.
+    If all `levels` have the same spatial shape, they are written directly into slices of the preallocated output.
+    Otherwise, `combine` is used to resize them to the shape of the first level.
+    """
+    spatial_shape = levels[0].shape[2:]
+    if any(level.shape[2:] != spatial_shape for level in levels[1:]):
+        return combine(levels)
+
+    output = empty_like_format(x, (x.shape[0], num_channels, *spatial_shape))
+    for level, channel_slice in zip(levels, channel_slices):
+        output[:, channel_slice] = level
+    return output
+
+
+def empty_like_format(x, shape):
+    """ Allocate tensor of a given `shape` with the same dtype, device and memory format as `x`.
+    Allows to keep the `channels_last` layout of inputs, set by the model, for the outputs of pyramid modules.
+    """
+    memory_format = torch.contiguous_format
+    if not x.is_contiguous():
+        if x.ndim == 4 and x.is_contiguous(memory_format=torch.channels_last):
+            memory_format = torch.channels_last
+        elif x.ndim == 5 and x.is_contiguous(memory_format=torch.channels_last_3d):
+            memory_format = torch.channels_last_3d
+    return torch.empty(shape, dtype=x.dtype, device=x.device, memory_format=memory_format)
+
+
+@lru_cache(maxsize=64)
+def pyramid_specs(spatial_shape, pyramid):
+    """ Pooling sizes and strides for each level of a pyramid, applied to inputs of a given `spatial_shape`.
+    Results are cached, so that repeated construction of pyramid modules for the same shapes is cheap.
+
+    Returns
+    -------
+    tuple
+        For each level, pair of `pool_size` and `pool_stride`; `None` for the levels with `0`.
+    """
+    specs = []
+    for level in pyramid:
+        if level == 0:
+            specs.append(None)
+        else:
+            pool_size = tuple(-(-size // level) for size in spatial_shape)
+            pool_stride = tuple((size - 1) // level + 1 for size in spatial_shape)
+            specs.append((pool_size, pool_stride))
+    return tuple(specs)
+
+
+class CUDAGraphMixin:
+    """ Run `eager_forward` of a module through a captured CUDA graph at inference.
+    The graph is captured on the first call and replayed for the inputs of the same shape, dtype and device:
+    this removes the Python and kernel launch overhead of many small branch operations.
+    Eager execution is used for training, computations with gradients, CPU inputs and when `cuda_graph` is False.
+    """
+    #pylint: disable=attribute-defined-outside-init
+    cuda_graph = False
+
+    def forward(self, x):
+        if not (self.cuda_graph and x.is_cuda and not self.training and not torch.is_grad_enabled()):
+            return self.eager_forward(x)
+
+        key = (x.shape, x.stride(), x.dtype, x.device)
+        if getattr(self, 'graph_key', None) != key:
+            self.capture_graph(x)
+            self.graph_key = key
+
+        self.graph_inputs.copy_(x)
+        self.graph.replay()
+        return self.graph_outputs.clone()
+
+    def capture_graph(self, x, n_warmup=3):
+        """ Warm up `eager_forward` on a side stream and capture it into a CUDA graph with static input/output. """
+        self.graph_inputs = x.clone()
+
+        stream = torch.cuda.Stream(device=x.device)
+        stream.wait_stream(torch.cuda.current_stream(x.device))
+        with torch.cuda.stream(stream):
+            for _ in range(n_warmup):
+                self.eager_forward(self.graph_inputs)
+        torch.cuda.current_stream(x.device).wait_stream(stream)
+
+        self.graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self.graph):
+            self.graph_outputs = self.eager_forward(self.graph_inputs)
+
+    def __getstate__(self):
+        # Captured graph and its static tensors are bound to the device and are re-created after loading
+        state = self.__dict__.copy()
+        for key in ['graph', 'graph_key', 'graph_inputs', 'graph_outputs']:
+            state.pop(key, None)
+        return state
+
+
+class PyramidPooling(CUDAGraphMixin, nn.Module):
     """ Pyramid Pooling module
     Zhao H. et al. "`Pyramid Scene Parsing Network <https://arxiv.org/abs/1612.01105>`_"
 
@@ -26,37 +123,51 @@ class PyramidPooling(nn.Module):
     pyramid : tuple of int
         Number of feature regions in each dimension.
         `0` is used to include `inputs` into the output tensor.
+    cuda_graph : bool
+        Whether to capture and replay CUDA graph of the module at inference. See :class:`.CUDAGraphMixin`.
     """
     def __init__(self, inputs, layout='cna', channels=None, kernel_size=1, pool_op='mean',
-                 pyramid=(0, 1, 2, 3, 6), **kwargs):
+                 pyramid=(0, 1, 2, 3, 6), cuda_graph=False, **kwargs):
         super().__init__()
+        self.cuda_graph = cuda_graph
 
-        spatial_shape = np.array(get_shape(inputs)[2:])
+        spatial_shape = tuple(get_shape(inputs)[2:])
         channels = channels if channels else f'same // {len(pyramid)}'
 
         modules = nn.ModuleList()
-        for level in pyramid:
-            if level == 0:
+        channel_offsets = [0]
+        for spec in pyramid_specs(spatial_shape, tuple(pyramid)):
+            if spec is None:
                 module = nn.Identity()
+                num_channels = get_num_channels(inputs)
             else:
                 x = inputs
-                pool_size = tuple(np.ceil(spatial_shape / level).astype(np.int32))
-                pool_stride = tuple(np.floor((spatial_shape - 1) / level + 1).astype(np.int32))
+                pool_size, pool_stride = spec
 
                 module = Block(inputs=x, layout='p' + layout + 'b', channels=channels, kernel_size=kernel_size,
                                pool_op=pool_op, pool_size=pool_size, pool_stride=pool_stride,
-                               factor=None, shape=tuple(spatial_shape), **kwargs)
+                               factor=None, shape=spatial_shape, **kwargs)
+                num_channels = get_num_channels(module(inputs))
             modules.append(module)
+            channel_offsets.append(channel_offsets[-1] + num_channels)
 
         self.blocks = modules
         self.combine = Combine(op='concat')
-
-    def forward(self, x):
+        self.num_channels = channel_offsets[-1]
+        # Channel slices of the output for each branch are fixed at construction, as well as the number of branches
+        self.channel_slices = tuple(slice(start, stop)
+                                    for start, stop in zip(channel_offsets[:-1], channel_offsets[1:]))
+
+    def eager_forward(self, x):
+        """ Apply pyramid branches to inputs and concatenate their outputs along channels.
+        Branches are upsampled to the spatial shape at construction: for inputs of other shapes,
+        they are resized to the shape of the first branch, as in :class:`~.layers.Combine`.
+        """
         levels = [layer(x) for layer in self.blocks]
-        return self.combine(levels)
+        return concat_into(x, levels, self.num_channels, self.channel_slices, self.combine)
 
 
-class ASPP(nn.Module):
+class ASPP(CUDAGraphMixin, nn.Module):
     """ Atrous Spatial Pyramid Pooling module.
 
     Chen L. et al. "`Rethinking Atrous Convolution for Semantic Image Segmentation
@@ -77,14 +188,17 @@ class ASPP(nn.Module):
         Default is 2, i.e. 2x2=4 pooling features will be calculated for 2d images,
         and 2x2x2=8 features per 3d item.
         Tuple allows to define several image level features, e.g (2, 3, 4).
+    cuda_graph : bool
+        Whether to capture and replay CUDA graph of the module at inference. See :class:`.CUDAGraphMixin`.
 
     See also
     --------
     PyramidPooling
     """
     def __init__(self, inputs=None, layout='cna', channels='same', kernel_size=3,
-                 rates=(6, 12, 18), pyramid=None, **kwargs):
+                 rates=(6, 12, 18), pyramid=None, cuda_graph=False, **kwargs):
         super().__init__()
+        self.cuda_graph = cuda_graph
 
         modules = nn.ModuleList()
         global_pooling = Block(inputs=inputs, layout='V>cnab', channels=channels,
@@ -108,9 +222,21 @@ class ASPP(nn.Module):
         self.blocks = modules
         self.combine = Combine(op='concat')
 
-    def forward(self, x):
+        # Output channels of each branch are known after construction, so channel slices are computed once
+        channel_offsets = [0]
+        for module in modules:
+            channel_offsets.append(channel_offsets[-1] + get_num_channels(module(inputs)))
+        self.num_channels = channel_offsets[-1]
+        self.channel_slices = tuple(slice(start, stop)
+                                    for start, stop in zip(channel_offsets[:-1], channel_offsets[1:]))
+
+    def eager_forward(self, x):
+        """ Apply all branches to inputs and concatenate their outputs along channels.
+        Global pooling branch is upsampled to the spatial shape at construction: for inputs of other shapes,
+        other branches are resized to it, as in :class:`~.layers.Combine`.
+        """
         levels = [layer(x) for layer in self.blocks]
-        return self.combine(levels)
+        return concat_into(x, levels, self.num_channels, self.channel_slices, self.combine)
 
 
 
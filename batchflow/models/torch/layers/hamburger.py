@@ -1,6 +1,8 @@
 """ Hamburger layer.
 Zhengyang Geng et al. "`Is attention better than matrix decomposition? <https://arxiv.org/abs/2109.04553>`_"
 """
+from contextlib import nullcontext
+
 import torch
 from torch import nn
 import torch.nn.functional as F
@@ -31,18 +33,38 @@ class Hamburger(nn.Module):
         Whether to perform attention along spatial or channel axis.
     rand_init : bool
         Whether to init matrix decomposition from scratches at each iteration.
+    autocast_dtype : torch.dtype, 'auto' or None
+        Dtype for matrix multiplications of the iterative MD steps.
+        If 'auto', then `torch.bfloat16` is used on CUDA devices with compute capability 8.0 and higher.
+        If None, then no autocast region is entered, so an outer one (e.g. from `amp` of the model) still applies.
+        Multiplicative updates of low precision tensors are performed in `float32`.
+    use_compile : bool or dict
+        If True, then `local_step` is compiled with `torch.compile`, so that elementwise updates are fused with
+        neighbouring matrix multiplications. The module itself is left eager.
+        If dict, then it is used as keyword arguments for compilation, e.g. `{'mode': 'reduce-overhead'}`.
+        Requires torch>=2.0. Default is False.
+    early_exit_tol : number
+        If positive, then MD steps at inference are stopped once the relative change of `coeff` becomes smaller.
+        The change is measured on every 16th element of `coeff` and checked every second step, as the check
+        synchronizes the device with the host. Disabled during CUDA graph capture. Default is 0, i.e. no early exit.
     """
     #pylint: disable=invalid-name
-    def __init__(self, inputs=None, S=1, R=64, n_train_steps=6, n_eval_steps=7, inv_t=1, spatial=True, rand_init=True):
+    def __init__(self, inputs=None, S=1, R=64, n_train_steps=6, n_eval_steps=7, inv_t=1, spatial=True, rand_init=True,
+                 autocast_dtype=None, use_compile=False, early_exit_tol=0):
         super().__init__()
+        _ = inputs
 
         self.S, self.R = S, R
         self.n_train_steps, self.n_eval_steps = n_train_steps, n_eval_steps
         self.inv_t = inv_t
 
-        self.device = inputs.device if inputs is not None else 'cpu'
         self.spatial = spatial
         self.rand_init = rand_init
+        self.autocast_dtype = autocast_dtype
+        if use_compile and not hasattr(torch, 'compile'):
+            raise ImportError(f'`use_compile` of Hamburger requires torch>=2.0, got {torch.__version__}')
+        self.use_compile = use_compile
+        self.early_exit_tol = early_exit_tol
 
 
     def forward(self, x):
@@ -60,20 +82,34 @@ class Hamburger(nn.Module):
 
         # (S, D, R) -> (B * S, D, R)
         if self.rand_init:
-            bases = self.build_bases(B, self.S, D, self.R)
+            bases = self.build_bases(B, self.S, D, self.R, device=x.device)
         else:
             if not hasattr(self, 'bases'):
-                bases = self.build_bases(1, self.S, D, self.R)
+                bases = self.build_bases(1, self.S, D, self.R, device=x.device)
                 self.register_buffer('bases', bases)
-            bases = self.bases.repeat(B, 1, 1)
+            # A view of the buffer for `S=1`; for `S>1`, `reshape` can't merge expanded batch axis with `S` and copies.
+            # Updates in `local_step` don't modify `bases` in-place, so the buffer itself is never changed
+            bases = self.bases.expand(B, -1, -1, -1).reshape(B * self.S, D, self.R)
+
+        # Transposed inputs are made contiguous once and reused by every MD step
+        # (B * S, D, N) -> (B * S, N, D)
+        xt = x.transpose(1, 2).contiguous()
+
+        autocast_dtype = self.get_autocast_dtype(x.device)
+        if autocast_dtype is not None:
+            context = torch.autocast(device_type=x.device.type, dtype=autocast_dtype)
+        else:
+            context = nullcontext()
 
-        bases, coeff = self.local_inference(x, bases)
+        with context:
+            bases, coeff = self.local_inference(x, xt, bases)
 
-        # (B * S, N, R)
-        coeff = self.compute_coeff(x, bases, coeff)
+            # (B * S, N, R)
+            coeff = self.compute_coeff(xt, bases, coeff)
 
         # (B * S, D, R) @ (B * S, N, R)^T -> (B * S, D, N)
-        x = torch.bmm(bases, coeff.transpose(1, 2))
+        # Updates may be upcasted to `float32`: output is returned in the dtype of inputs
+        x = torch.bmm(bases, coeff.transpose(1, 2)).to(x.dtype)
 
         # (B * S, D, N) -> (B, C, H, W)
         if self.spatial:
@@ -82,49 +118,106 @@ class Hamburger(nn.Module):
             x = x.transpose(1, 2).view(B, C, H, W)
         return x
 
-    def build_bases(self, B, S, D, R):
-        """ Make an initial guess for matrix factorization. """
-        bases = torch.rand((B * S, D, R), device=self.device)
-        bases = F.normalize(bases, dim=1)
+    def get_autocast_dtype(self, device):
+        """ Select dtype for autocasting the iterative MD steps on a given `device`. """
+        if self.autocast_dtype == 'auto':
+            if device.type == 'cuda' and torch.cuda.get_device_capability(device)[0] >= 8:
+                return torch.bfloat16
+            return None
+        return self.autocast_dtype
+
+    def build_bases(self, B, S, D, R, device=None):
+        """ Make an initial guess for matrix factorization on the `device` of inputs. """
+        bases = torch.rand((B * S, D, R), device=device)
+        bases = F.normalize(bases, dim=1, out=bases)
         return bases
 
     @torch.no_grad()
-    def local_inference(self, x, bases):
-        """ Multiple updates of `bases` and `coeff` to better match `x`. """
-        # (B * S, D, N)^T @ (B * S, D, R) -> (B * S, N, R)
-        coeff = torch.bmm(x.transpose(1, 2), bases)
+    def local_inference(self, x, xt, bases):
+        """ Multiple updates of `bases` and `coeff` to better match `x`; `xt` is its contiguous transpose. """
+        # (B * S, N, D) @ (B * S, D, R) -> (B * S, N, R)
+        coeff = torch.bmm(xt, bases)
         coeff = F.softmax(self.inv_t * coeff, dim=-1)
 
+        local_step = self.get_local_step()
         steps = self.n_train_steps if self.training else self.n_eval_steps
-        for _ in range(steps):
-            bases, coeff = self.local_step(x, bases, coeff)
+        early_exit = (not self.training and self.early_exit_tol > 0
+                      and not (x.is_cuda and torch.cuda.is_current_stream_capturing()))
+
+        for i in range(steps):
+            check = early_exit and i % 2 == 1 and i < steps - 1
+            if check:
+                prev_coeff = coeff.flatten(1)[:, ::16].float()
+
+            bases, coeff = local_step(x, xt, bases, coeff)
+
+            if check:
+                delta = (coeff.flatten(1)[:, ::16] - prev_coeff).norm(dim=1)
+                if bool(torch.all(delta / (prev_coeff.norm(dim=1) + 1e-8) < self.early_exit_tol)):
+                    break
         return bases, coeff
 
+    def get_local_step(self):
+        """ Either eager or compiled version of `local_step`, depending on `use_compile`. """
+        #pylint: disable=attribute-defined-outside-init
+        if not self.use_compile:
+            return self.local_step
+
+        if getattr(self, 'compiled_step', None) is None:
+            # Batch size and spatial shape of inputs vary between calls, so the compiled step is not specialized on them
+            compile_kwargs = {'mode': 'max-autotune', 'dynamic': True,
+                              **(self.use_compile if isinstance(self.use_compile, dict) else {})}
+            self.compiled_step = torch.compile(self.local_step, **compile_kwargs)
+        return self.compiled_step
+
+    def __getstate__(self):
+        # Compiled function is bound to the instance and is re-created after loading
+        state = self.__dict__.copy()
+        state.pop('compiled_step', None)
+        return state
+
     @torch.no_grad()
-    def local_step(self, x, bases, coeff):
-        """ Update `bases` and `coeff` to better match `x`. """
-        # (B * S, D, N)^T @ (B * S, D, R) -> (B * S, N, R)
-        numerator = torch.bmm(x.transpose(1, 2), bases)
-        # (B * S, N, R) @ [(B * S, D, R)^T @ (B * S, D, R)] -> (B * S, N, R)
-        denominator = coeff.bmm(bases.transpose(1, 2).bmm(bases))
+    def local_step(self, x, xt, bases, coeff):
+        """ Update `bases` and `coeff` to better match `x`.
+        Both `R x R` gram matrices are computed once per step, and elementwise updates are done in-place
+        to avoid materializing additional `(B * S, N, R)` and `(B * S, D, R)` temporaries.
+        """
+        # (B * S, N, D) @ (B * S, D, R) -> (B * S, N, R)
+        numerator = torch.bmm(xt, bases)
+        # (B * S, D, R)^T @ (B * S, D, R) -> (B * S, R, R)
+        gram = torch.bmm(bases.transpose(1, 2), bases)
+        # (B * S, N, R) @ (B * S, R, R) -> (B * S, N, R)
+        numerator, denominator = self.upcast(numerator, torch.bmm(coeff, gram))
         # Multiplicative Update
-        coeff = coeff * numerator / (denominator + 1e-6)
+        coeff = numerator.mul_(coeff).div_(denominator.add_(1e-6))
 
         # (B * S, D, N) @ (B * S, N, R) -> (B * S, D, R)
         numerator = torch.bmm(x, coeff)
-        # (B * S, D, R) @ [(B * S, N, R)^T @ (B * S, N, R)] -> (B * S, D, R)
-        denominator = bases.bmm(coeff.transpose(1, 2).bmm(coeff))
+        # (B * S, N, R)^T @ (B * S, N, R) -> (B * S, R, R)
+        gram = torch.bmm(coeff.transpose(1, 2), coeff)
+        # (B * S, D, R) @ (B * S, R, R) -> (B * S, D, R)
+        numerator, denominator = self.upcast(numerator, torch.bmm(bases, gram))
         # Multiplicative Update
-        bases = bases * numerator / (denominator + 1e-6)
+        bases = numerator.mul_(bases).div_(denominator.add_(1e-6))
 
         return bases, coeff
 
-    def compute_coeff(self, x, bases, coeff):
-        """ Update `coeff` to better match `x` with given `bases`. """
-        # (B * S, D, N)^T @ (B * S, D, R) -> (B * S, N, R)
-        numerator = torch.bmm(x.transpose(1, 2), bases)
+    def compute_coeff(self, xt, bases, coeff):
+        """ Update `coeff` to better match transposed inputs `xt` with given `bases`. """
+        # (B * S, N, D) @ (B * S, D, R) -> (B * S, N, R)
+        numerator = torch.bmm(xt, bases)
         # (B * S, N, R) @ (B * S, D, R)^T @ (B * S, D, R) -> (B * S, N, R)
         denominator = coeff.bmm(bases.transpose(1, 2).bmm(bases))
+        numerator, denominator = self.upcast(numerator, denominator)
         # multiplication update
         coeff = coeff * numerator / (denominator + 1e-6)
         return coeff
+
+    @staticmethod
+    def upcast(numerator, denominator):
+        """ Cast `numerator` and `denominator` of a multiplicative update to `float32`, if they are in half precision.
+        Otherwise, they are returned as is: updates are done in the dtype of inputs.
+        """
+        if numerator.dtype in (torch.float16, torch.bfloat16) or denominator.dtype in (torch.float16, torch.bfloat16):
+            return numerator.float(), denominator.float()
+        return numerator, denominator
@@ -117,13 +117,16 @@ class UNet(TorchModel):
             num_stages = config.get('auto_build/num_stages', 4)
             channels = config.get('auto_build/channels', 64)
             encoder_channels = [channels * 2**i for i in range(num_stages)]
-
-            config['encoder/num_stages'] = num_stages
-            config['encoder/blocks/channels'] = encoder_channels
-            config['embedding/channels'] = encoder_channels[-1] * 2
-            config['decoder/num_stages'] = num_stages
-            config['decoder/blocks/channels'] = encoder_channels[::-1]
-            config['decoder/upsample/channels'] = encoder_channels[::-1]
+            decoder_channels = encoder_channels[::-1]
+
+            config.update({
+                'encoder/num_stages': num_stages,
+                'encoder/blocks/channels': encoder_channels,
+                'embedding/channels': encoder_channels[-1] * 2,
+                'decoder/num_stages': num_stages,
+                'decoder/blocks/channels': decoder_channels,
+                'decoder/upsample/channels': decoder_channels,
+            })
 
         if not config.get('decoder/upsample/channels'):
             warnings.warn("'decoder/upsample/channels' are not set and " + \
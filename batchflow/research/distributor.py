@@ -25,9 +25,11 @@ class DynamicQueue:
         self.random_seed = seed
         self.random = make_rng(seed)
 
-        self.queue = mp.JoinableQueue()
-        self.done_flag = mp.JoinableQueue()
+        # Finished tasks are counted by flags in `done_flag`, so queues are never joined
+        self.queue = mp.Queue()
+        self.done_flag = mp.Queue()
 
+        # Counters are used only by the distributor in the parent process: workers just get tasks from `queue`
         self.configs_generated = 0
         self.configs_remains = self.domain.size
 
@@ -54,23 +56,17 @@ class DynamicQueue:
 
     def next_tasks(self, n_tasks=1):
         """ Get next `n_tasks` elements of queue. """
-        configs = []
-        for i in range(n_tasks):
-            branches_tasks = [] # TODO: rename it
-            try:
-                for _ in range(self.n_branches):
-                    config = next(self.domain)
-                    config['id'] = generate_id(config, self.random, self.research.create_id_prefix)
-                    branches_tasks.append(config)
-                configs.append(branches_tasks)
-            except StopIteration:
-                if len(branches_tasks) > 0:
-                    configs.append(branches_tasks)
-                break
+        # Configs for all tasks are taken from domain at once and then split into groups for branches.
+        # If domain is exhausted, the last group can be incomplete
+        flat_configs = list(itertools.islice(self.domain.iterator, n_tasks * self.n_branches))
+        for config in flat_configs:
+            config['id'] = generate_id(config, self.random, self.research.create_id_prefix)
+        configs = [flat_configs[i:i + self.n_branches] for i in range(0, len(flat_configs), self.n_branches)]
+
         for i, executor_configs in enumerate(configs):
             self.put((self.configs_generated + i, executor_configs))
 
-        n_configs = sum([len(item) for item in configs])
+        n_configs = sum(len(item) for item in configs)
 
         self.configs_generated += n_configs
         self.configs_remains -= n_configs
@@ -85,11 +81,9 @@ class DynamicQueue:
             self.put(None)
 
     def task_done(self):
-        self.queue.task_done()
         self.done_flag.put(None)
 
     def worker_failed(self):
-        self.queue.task_done()
         self.done_flag.put('error')
 
     def wait_for_finished_task(self):
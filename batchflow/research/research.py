@@ -2,9 +2,11 @@
 """ Research class for muliple parallel experiments. """
 
 import time
+import threading
 import itertools
 import warnings
 import psutil
+import numpy as np
 import multiprocess as mp
 import tqdm
 
@@ -191,14 +193,7 @@ class Research:
                 devices = list(itertools.chain.from_iterable(itertools.repeat(x, branches_per_device) for x in devices))
             if len(devices) % total_n_branches == 0:
                 devices_per_branch = len(devices) // total_n_branches
-                devices = [
-                    [
-                        [
-                            devices[n_branches * devices_per_branch * i + devices_per_branch * j + k]
-                            for k in range(devices_per_branch)
-                        ] for j in range(n_branches)
-                    ] for i in range(n_workers)
-                ]
+                devices = np.array(devices, dtype=object).reshape(n_workers, n_branches, devices_per_branch).tolist()
         if isinstance(devices[0], list):
             def _transform_item(x):
                 x = to_list(x)
@@ -371,11 +366,13 @@ class Research:
 
         self.logger.info("Research is starting")
 
-        self.monitor.start()
         if self.parallel:
+            # Handler thread is started after the fork: forking a process with running threads may deadlock the child
+            self.monitor.start(handler=False)
             try:
                 self.process = mp.Process(target=_start_distributor)
                 self.process.start()
+                self.monitor.start_handler()
                 self.logger.info(f"Create separate research process [pid:{self.process.pid}]")
                 self.monitor.detach(self.process)
                 if not detach:
@@ -388,6 +385,7 @@ class Research:
         else:
             if detach:
                 warnings.warn("detach can't be enabled when parallel=False")
+            self.monitor.start()
             _start_distributor()
             self.terminate()
         return self
@@ -425,7 +423,7 @@ class Research:
                     if self.logger:
                         self.logger.info("Terminate research processes")
 
-                    order = {'EXECUTOR': 1, 'WORKER': 2, 'DETACHED_PROCESS': 3, 'MONITOR': 4}
+                    order = {'EXECUTOR': 1, 'WORKER': 2, 'DETACHED_PROCESS': 3}
                     processes_to_kill = sorted(self.monitor.processes.items(), key=lambda x: order[x[1]])
                     for pid, process_type in processes_to_kill:
                         if pid is not None and psutil.pid_exists(pid):
@@ -490,20 +488,19 @@ class ResearchMonitor:
                         'generated_experiments', 'stopped']
 
     def __init__(self, research, bar=True):
-        self.queue = mp.JoinableQueue()
-        self.stop_signal = mp.JoinableQueue()
+        # Queues are used only to pass stop signals: `task_done`/`join` are not needed
+        self.queue = mp.Queue()
+        self.stop_signal = mp.Queue()
         self._manager = mp.Manager()
         self.exceptions = self._manager.list()
-        self.shared_values = self._manager.dict()
+        # Counters are shared between processes by `mp.Value`: access to them doesn't need requests to the manager
+        self.shared_values = {key: mp.Value('q', 0) for key in self.SHARED_VARIABLES}
         self.current_iterations = self._manager.dict()
         self.processes = self._manager.dict({self._manager._process.pid: "MANAGER"})
 
         self.research = research
         self.bar = tqdm.tqdm(disable=(not bar), position=0, leave=True) if isinstance(bar, bool) else bar
 
-        for key in self.SHARED_VARIABLES:
-            self.shared_values[key] = 0
-
         self.n_iters = self.research.n_iters
 
         self.dump = False
@@ -512,15 +509,25 @@ class ResearchMonitor:
 
     def __getattr__(self, key):
         if key in self.SHARED_VARIABLES:
-            return self.shared_values[key]
+            value = self.shared_values[key]
+            return getattr(value, 'value', value)
         raise AttributeError(f'Unknown attribute: {key}')
 
     def __setattr__(self, key, value):
         if key in self.SHARED_VARIABLES:
-            self.shared_values[key] = value
+            if hasattr(self.shared_values[key], 'value'):
+                self.shared_values[key].value = value
+            else:
+                self.shared_values[key] = value
         else:
             super().__setattr__(key, value)
 
+    def increment(self, key, value=1):
+        """ Atomically increase shared counter `key` by `value`. """
+        shared_value = self.shared_values[key]
+        with shared_value.get_lock():
+            shared_value.value += value
+
     @property
     def total(self):
         """ Total number of iterations or experiments in the current moment. It changes after domain updates. """
@@ -563,8 +570,8 @@ class ResearchMonitor:
     def stop_experiment(self, experiment):
         """" Signal when experiment stops. """
         self.current_iterations.pop(experiment.id)
-        self.finished_iterations += experiment.iteration + 1
-        self.finished_experiments += 1
+        self.increment('finished_iterations', experiment.iteration + 1)
+        self.increment('finished_experiments')
 
     def execute_iteration(self, experiment):
         """" Signal for iteration execution. """
@@ -593,12 +600,14 @@ class ResearchMonitor:
             last_update = False
             exceptions = 0
             while True:
-                if (progress.n != self.n) or (progress.total != self.total) or (len(self.exceptions) != exceptions):
-                    if len(self.exceptions) != exceptions:
-                        exceptions = len(self.exceptions)
+                # Each property reads several shared values from the manager process, so they are read once per poll
+                n, total, n_exceptions = self.n, self.total, len(self.exceptions)
+                if (progress.n != n) or (progress.total != total) or (n_exceptions != exceptions):
+                    if n_exceptions != exceptions:
+                        exceptions = n_exceptions
                         progress.set_description_str(f"Exceptions: {exceptions}")
-                    progress.n = self.n
-                    progress.total = self.total
+                    progress.n = n
+                    progress.total = total
                     progress.refresh()
                 if last_update:
                     break
@@ -607,13 +616,20 @@ class ResearchMonitor:
                     last_update = True
         self.stop_signal.put(None)
 
-    def start(self):
-        """ Start handler. """
+    def start(self, handler=True):
+        """ Start monitor. If `handler` is False, the handler thread must be started later by :meth:`.start_handler`:
+        it allows to fork processes, which can stop the monitor, before any thread is running.
+        """
         if self.stopped:
-            self.process = mp.Process(target=self.handler)
-            self.process.start()
-            self.processes[self.process.pid] = 'MONITOR'
             self.stopped = False
+            if handler:
+                self.start_handler()
+
+    def start_handler(self):
+        """ Start handler. """
+        # Handler only reads shared values and updates the progress bar, so a thread of the main process is enough
+        self.process = threading.Thread(target=self.handler, daemon=True)
+        self.process.start()
 
     def stop(self, wait=True):
         """ Stop handler. """
@@ -624,10 +640,16 @@ class ResearchMonitor:
             self.stopped = True
         tqdm.tqdm._instances.clear() #pylint:disable=protected-access
 
+    def __getstate__(self):
+        # Handler thread belongs to the main process and can't be pickled
+        state = self.__dict__.copy()
+        state['process'] = None
+        return state
+
     def close(self):
         """ Close manager. """
         self.exceptions = list(self.exceptions)
-        self.shared_values = dict(self.shared_values)
+        self.shared_values = {key: getattr(value, 'value', value) for key, value in self.shared_values.items()}
         self.current_iterations = dict(self.current_iterations)
         self.processes = dict(self.processes)
         self._manager.shutdown()
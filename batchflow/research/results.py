@@ -1,7 +1,7 @@
 """ Research results. """
 
 import os
-import functools
+import bisect
 from collections import OrderedDict
 import glob
 import multiprocess as mp
@@ -9,7 +9,8 @@ import pandas as pd
 import numpy as np
 
 from ..utils import to_list
-from .utils import deserialize
+from .domain import ConfigAlias
+from .utils import deserialize, deserialize_records
 
 class ResearchResults:
     """ Class to collect, load and process research results.
@@ -31,6 +32,7 @@ class ResearchResults:
         self.configs = self._manager.dict()
         self.artifacts = dict()
         self.kwargs = kwargs
+        self._config_index = None
 
         if dump_results and os.path.exists(name):
             self.load()
@@ -46,8 +48,8 @@ class ResearchResults:
             self.load_configs()
             self.load_results(**kwargs)
             self.load_artifacts(**kwargs)
-        self.results = dict(self.results)
-        self.configs = dict(self.configs)
+        self.results = self.snapshot(self.results)
+        self.configs = self.snapshot(self.configs)
         self.close_manager()
 
     def load_configs(self):
@@ -80,23 +82,38 @@ class ResearchResults:
             is used as `config`. If `config` is not defined but `alias` is, then will be concated to `alias`.
         """
         experiment_id, name, iterations = self.filter(experiment_id, name, iterations, config, alias, domain, **kwargs)
+        experiment_id = None if experiment_id is None else set(experiment_id)
+        name = None if name is None else set(name)
+        iterations = None if iterations is None else frozenset(iterations)
+
+        # Folders are walked level by level, so that ids and names are taken from entries without parsing paths,
+        # and folders of filtered out experiments are not listed at all
         results = dict()
-        for path in glob.glob(os.path.join(self.name, 'experiments', '*', 'results', '*')):
-            path = os.path.normpath(path)
-            _experiment_id, _, _name = path.split(os.sep)[-3:]
+        for experiment_entry in self._scandir(os.path.join(self.name, 'experiments')):
+            _experiment_id = experiment_entry.name
             if experiment_id is None or _experiment_id in experiment_id:
-                if name is None or _name in name:
-                    if _experiment_id not in results:
-                        results[_experiment_id] = OrderedDict()
-                    experiment_results = results[_experiment_id]
-
-                    if _name not in experiment_results:
-                        experiment_results[_name] = OrderedDict()
-                    name_results = experiment_results[_name]
-                    new_values = self.load_iteration_files(path, iterations)
-                    experiment_results[_name] = OrderedDict([*name_results.items(), *new_values.items()])
+                for name_entry in self._scandir(os.path.join(experiment_entry.path, 'results')):
+                    _name = name_entry.name
+                    if name is None or _name in name:
+                        if _experiment_id not in results:
+                            results[_experiment_id] = OrderedDict()
+                        experiment_results = results[_experiment_id]
+
+                        if _name not in experiment_results:
+                            experiment_results[_name] = OrderedDict()
+                        name_results = experiment_results[_name]
+                        new_values = self.load_iteration_files(name_entry.path, iterations)
+                        experiment_results[_name] = OrderedDict([*name_results.items(), *new_values.items()])
         self.results = results
 
+    @staticmethod
+    def _scandir(path):
+        """ Non-hidden entries of a folder, as matched by `glob`. Empty list if folder doesn't exist. """
+        if not os.path.isdir(path):
+            return []
+        with os.scandir(path) as entries:
+            return [entry for entry in entries if not entry.name.startswith('.')]
+
     def load_artifacts(self, experiment_id=None, name=None, config=None, alias=None, domain=None, **kwargs):
         """ Load and filter experiment artifacts (all files/folders in experiment folder except standart
         'results', 'config.dill', 'config.json', 'experiment.log').
@@ -119,6 +136,7 @@ class ResearchResults:
         self.artifacts = dict()
         names = to_list('*' if name is None else name)
         experiment_id, _, _ = self.filter(experiment_id, None, None, config, alias, domain, **kwargs)
+        experiment_id = None if experiment_id is None else set(experiment_id)
         for _name in names:
             for path in glob.glob(os.path.join(self.name, 'experiments', '*', _name)):
                 if os.path.basename(path) not in ['results', 'config.dill', 'config.json', 'experiment.log']:
@@ -201,34 +219,47 @@ class ResearchResults:
         kwargs = {**self.kwargs, **kwargs}
         experiment_ids, names, iterations = self.filter(**kwargs)
 
-        df = []
+        all_results = self.snapshot(self.results)
+        iterations = None if iterations is None else set(iterations)
+
+        # Values of all experiments are gathered into plain lists, and only one dataframe is created from them
+        ids, iteration_values = [], []
+        columns = OrderedDict() # values of each name, aligned with rows, if `pivot`
+        name_values, values = [], [] # long format otherwise
         for experiment_id in experiment_ids:
-            if experiment_id in self.results:
-                experiment_df = []
-                for name in (names or self.results[experiment_id]):
-                    if name in self.results[experiment_id]:
-                        _df = {
-                            'id': experiment_id,
-                            'iteration': self.results[experiment_id][name].keys()
-                        }
-                        if pivot:
-                            _df[name] = self.results[experiment_id][name].values()
-                        else:
-                            _df['name'] = name
-                            _df['value'] = self.results[experiment_id][name].values()
-                        _df = pd.DataFrame(_df)
-                        if iterations is not None:
-                            _df = _df[_df.iteration.isin(iterations)]
-                        experiment_df += [_df]
-                if pivot and len(experiment_df) > 0:
-                    experiment_df = [
-                        functools.reduce(
-                            functools.partial(pd.merge, on=['id', 'iteration'], how='outer'),
-                            experiment_df
-                        )
-                    ]
-                df += experiment_df
-        res = pd.concat(df) if len(df) > 0 else pd.DataFrame()
+            if experiment_id in all_results:
+                experiment_results = all_results[experiment_id]
+                selected_names = [name for name in (names or experiment_results) if name in experiment_results]
+                if pivot:
+                    # Rows of experiment are the union of iterations of all names, as with the outer join
+                    experiment_iterations = sorted({iteration for name in selected_names
+                                                    for iteration in experiment_results[name]
+                                                    if iterations is None or iteration in iterations})
+                    n_rows = len(ids)
+                    ids += [experiment_id] * len(experiment_iterations)
+                    iteration_values += experiment_iterations
+                    for name in selected_names:
+                        column = columns.setdefault(name, [])
+                        column += [np.nan] * (n_rows - len(column))
+                        name_results = experiment_results[name]
+                        column += [name_results.get(iteration, np.nan) for iteration in experiment_iterations]
+                else:
+                    for name in selected_names:
+                        for iteration, value in experiment_results[name].items():
+                            if iterations is None or iteration in iterations:
+                                ids.append(experiment_id)
+                                iteration_values.append(iteration)
+                                name_values.append(name)
+                                values.append(value)
+
+        if len(ids) == 0:
+            res = pd.DataFrame()
+        elif pivot:
+            for column in columns.values():
+                column += [np.nan] * (len(ids) - len(column))
+            res = pd.DataFrame({'id': ids, 'iteration': iteration_values, **columns})
+        else:
+            res = pd.DataFrame({'id': ids, 'iteration': iteration_values, 'name': name_values, 'value': values})
         if include_config and len(res) > 0:
             left = self.configs_to_df(use_alias, concat_config, remove_auxilary, drop_columns)
             res = pd.merge(left, res, how='inner', on='id')
@@ -236,23 +267,21 @@ class ResearchResults:
 
     def load_iteration_files(self, path, iterations):
         """ Load files for specified iterations from specified path. """
-        filenames = glob.glob(os.path.join(path, '*'))
+        # Each file is named by the last iteration it contains
+        with os.scandir(path) as entries:
+            dumped_files = sorted((int(entry.name), entry.path) for entry in entries if not entry.name.startswith('.'))
         if iterations is None:
-            files_to_load = {int(os.path.basename(filename)): filename for filename in filenames}
+            files_to_load = dumped_files
         else:
-            dumped_iteration = np.sort(np.array([int(os.path.basename(filename)) for filename in filenames]))
-            files_to_load = dict()
-            for iteration in iterations:
-                _it = dumped_iteration[np.argwhere(dumped_iteration >= iteration)[0, 0]]
-                files_to_load[_it] = os.path.join(path, str(_it))
-        files_to_load = OrderedDict(sorted(files_to_load.items()))
+            dumped_iterations = [iteration for iteration, _ in dumped_files]
+            indices = {bisect.bisect_left(dumped_iterations, iteration) for iteration in iterations}
+            files_to_load = [dumped_files[idx] for idx in sorted(indices)]
+        if iterations is not None and not isinstance(iterations, (set, frozenset)):
+            iterations = frozenset(iterations)
         results = OrderedDict()
-        for filename in files_to_load.values():
+        for _, filename in files_to_load:
             with open(filename, 'rb') as f:
-                values = deserialize(f)
-                for iteration in values:
-                    if iterations is None or iteration in iterations:
-                        results[iteration] = values[iteration]
+                results.update(deserialize_records(f, iterations))
         return results
 
     def configs_to_df(self, use_alias=True, concat_config=False, remove_auxilary=True, drop_columns=True):
@@ -274,30 +303,23 @@ class ResearchResults:
         -------
         pandas.DataFrame
         """
-        df = []
-        for experiment_id in self.configs:
-            config = self.configs[experiment_id]
-            if remove_auxilary:
-                for key in ['repetition', 'device', 'updates']:
-                    config.pop_config(key)
-            if concat_config:
-                popped = config.pop_config(['repetition', 'device', 'updates'])
-                if popped is None:
-                    popped = {}
-                else:
-                    popped = popped.alias() if use_alias else popped.config()
-                _config = {'config': config.alias(as_string=concat_config), **popped}
+        auxilary_keys = ['repetition', 'device', 'updates']
+        rows = []
+        for experiment_id, config in self.snapshot(self.configs).items():
+            # Auxilary keys are popped at once from a copy, so that stored config is not changed
+            config = ConfigAlias(config)
+            popped = config.pop_config(auxilary_keys) if remove_auxilary or concat_config else None
+            if remove_auxilary or popped is None:
+                popped = {}
             else:
-                _config = {}
+                popped = popped.alias() if use_alias else popped.config()
 
+            _config = {'config': config.alias(as_string=True), **popped} if concat_config else {}
             if not concat_config or not drop_columns:
-                if use_alias:
-                    _config = {**_config, **config.alias()}
-                else:
-                    _config = {**_config, **config.config()}
+                _config.update(config.alias() if use_alias else config.config())
 
-            df += [pd.DataFrame({'id': [experiment_id], **{key: [val] for key, val in _config.items()}})]
-        return pd.concat(df)
+            rows.append({'id': experiment_id, **_config})
+        return pd.DataFrame(rows, columns=None if rows else ['id'])
 
     def artifacts_to_df(self, include_config=True, use_alias=False, concat_config=False,
                         remove_auxilary=True, drop_columns=True, **kwargs):
@@ -361,12 +383,11 @@ class ResearchResults:
         """
         if sum([domain is not None, config is not None, alias is not None]) > 1:
             raise ValueError('Only one of `config`, `alias` and `domain` can be not None')
-        filtered_ids = []
         if domain is not None:
             domain.reset_iter()
-            for _config in domain.iterator:
-                filtered_ids += self.filter_ids_by_configs(config=_config.config())
-            return filtered_ids
+            domain_configs = [_config.config() for _config in domain.iterator]
+            return [experiment_id for experiment_id, (_config, _) in self.config_index.items()
+                    if any(self._match(_config, domain_config) for domain_config in domain_configs)]
 
         if len(kwargs) > 0:
             if config is not None:
@@ -377,21 +398,44 @@ class ResearchResults:
                 config = kwargs
 
         if config is None and alias is None:
-            return list(self.configs.keys())
+            return list(self.config_index.keys())
 
-        for experiment_id, supconfig in self.configs.items():
-            if config is not None:
-                _config = supconfig.config()
-                if all(item in _config.items() for item in config.items()):
-                    filtered_ids += [experiment_id]
-            else:
-                _config = supconfig.alias()
-                if all(item in _config.items() for item in alias.items()):
-                    filtered_ids += [experiment_id]
-        return filtered_ids
+        if config is not None:
+            return [experiment_id for experiment_id, (_config, _) in self.config_index.items()
+                    if self._match(_config, config)]
+        return [experiment_id for experiment_id, (_, _alias) in self.config_index.items()
+                if self._match(_alias, alias)]
+
+    @property
+    def config_index(self):
+        """ Dict with pairs of `config()` and `alias()` of each experiment config.
+        Pairs are cached for each config object and recomputed only for added or replaced configs. While research
+        is running, configs are fetched from the manager process as new objects, so all pairs are recomputed. """
+        cache = getattr(self, '_config_index', None) or {}
+        index = {}
+        for experiment_id, supconfig in self.snapshot(self.configs).items():
+            cached = cache.get(experiment_id)
+            if cached is None or cached[0] is not supconfig:
+                cached = (supconfig, supconfig.config(), supconfig.alias())
+            index[experiment_id] = cached
+        self._config_index = index
+        return {experiment_id: (config, alias) for experiment_id, (_, config, alias) in index.items()}
+
+    @staticmethod
+    def _match(config, subconfig):
+        """ Check that all items of `subconfig` are in `config`. """
+        items = config.items()
+        return all(item in items for item in subconfig.items())
+
+    @staticmethod
+    def snapshot(container):
+        """ Local copy of `results` or `configs`. While research is running, they are stored in the manager process
+        and each item access is a separate request to it, so the whole dict is fetched at once before processing.
+        """
+        return container if isinstance(container, dict) else container.copy()
 
     def close_manager(self):
         """ Close manager. """
-        self.results = dict(self.results)
-        self.configs = dict(self.configs)
+        self.results = self.snapshot(self.results)
+        self.configs = self.snapshot(self.configs)
         self._manager.shutdown()
@@ -4,7 +4,6 @@ import logging
 import os
 import sys
 import re
-import glob
 import json
 import io
 import warnings
@@ -18,7 +17,7 @@ import multiprocess as mp
 from .profiler import ExperimentProfiler, ResearchProfiler
 from .results import ResearchResults
 from ..utils import to_list
-from .utils import create_logger, jsonify, create_output_stream
+from .utils import create_logger, jsonify, create_output_stream, serialize_records
 
 class BaseExperimentStorage:
     """ Storage for experiment data.
@@ -194,11 +193,10 @@ class LocalExperimentStorage(BaseExperimentStorage):
             values = self.results[var]
             iteration = self.experiment.iteration
             variable_path = os.path.join(self.full_path, 'results', var)
-            if not os.path.exists(variable_path):
-                os.makedirs(variable_path)
+            os.makedirs(variable_path, exist_ok=True)
             filename = os.path.join(variable_path, str(iteration))
             with open(filename, 'wb') as file:
-                dill.dump(values, file)
+                serialize_records(values, file)
             del self.results[var]
 
     # Initialization methods
@@ -207,10 +205,10 @@ class LocalExperimentStorage(BaseExperimentStorage):
         """ Create folder for experiment results. """
         self.experiment_path = os.path.join('experiments', self.experiment.id)
         self.full_path = os.path.join(self.experiment.name, self.experiment_path)
-        if not os.path.exists(self.full_path):
+        try:
             os.makedirs(self.full_path)
-        else:
-            raise ValueError(f'Experiment folder {self.full_path} already exists.')
+        except FileExistsError as e:
+            raise ValueError(f'Experiment folder {self.full_path} already exists.') from e
 
     def _create_logger(self):
         """ Create loggers. """
@@ -379,21 +377,37 @@ class BaseResearchStorage:
         all_commands = [('env_state', command) for command in args]
         all_commands = [*all_commands, *kwargs.items()]
 
-        for filename, command in all_commands:
-            if command.startswith('#'):
-                if command[1:] == 'python':
-                    result = sys.version
+        for _, command in all_commands:
+            if command.startswith('#') and command[1:] != 'python':
+                raise ValueError(f'Unknown env: {command}')
+
+        # All commands are started at once and run concurrently, their outputs are collected afterwards
+        processes = []
+        try:
+            for filename, command in all_commands:
+                if command.startswith('#'):
+                    process = None
                 else:
-                    raise ValueError(f'Unknown env: {command}')
-            else:
-                process = subprocess.Popen(command.split(), stdout=subprocess.PIPE, cwd=cwd)
-                output, _ = process.communicate()
-                result = output.decode('utf')
-            if replace is not None:
-                for key, value in replace.items():
-                    result = re.sub(key, value, result)
+                    process = subprocess.Popen(command.split(), stdout=subprocess.PIPE, cwd=cwd)
+                processes.append((filename, process))
 
-            self._store_env(result, dst, filename)
+            for filename, process in processes:
+                if process is None:
+                    result = sys.version
+                else:
+                    output, _ = process.communicate()
+                    result = output.decode('utf')
+                if replace is not None:
+                    for key, value in replace.items():
+                        result = re.sub(key, value, result)
+
+                self._store_env(result, dst, filename)
+        finally:
+            # Processes are not left running if a command can't be started or its output can't be stored
+            for _, process in processes:
+                if process is not None and process.poll() is None:
+                    process.kill()
+                    process.wait()
 
     def _store_env(self, *args, **kwargs):
         """ The method which defines the way to save the output of the command. """
@@ -517,11 +531,9 @@ class LocalResearchStorage(BaseResearchStorage):
         """ Create storage folder. """
         if os.path.exists(self.path):
             raise ValueError(f"Research storage '{self.path}' already exists")
-        os.makedirs(self.path)
+        # Storage folder itself is created together with the first subfolder
         for subfolder in ['env', 'experiments']:
-            path = os.path.join(self.path, subfolder)
-            if not os.path.exists(path):
-                os.makedirs(path)
+            os.makedirs(os.path.join(self.path, subfolder), exist_ok=True)
 
     def _dump_research(self, research):
         with open(os.path.join(self.path, 'research.dill'), 'wb') as f:
@@ -551,15 +563,35 @@ class LocalResearchStorage(BaseResearchStorage):
 
     @property
     def env(self):
-        """ Environment state. """
+        """ Environment state. Files are reread only if they were modified since the previous call. """
+        #pylint: disable=attribute-defined-outside-init
+        if getattr(self, '_env_cache', None) is None:
+            self._env_cache = {}
+
         env = dict()
-        filenames = glob.glob(os.path.join(self.path, 'env', '*'))
-        for filename in filenames:
-            name = os.path.splitext(os.path.basename(filename))[0]
-            with open(filename, 'r') as file:
-                env[name] = file.read().strip()
+        for name, path, mtime in self._scan_env(os.path.join(self.path, 'env')):
+            cached = self._env_cache.get(path)
+            if cached is None or cached[0] != mtime:
+                with open(path, 'r') as file:
+                    cached = (mtime, file.read().strip())
+                self._env_cache[path] = cached
+            env[name] = cached[1]
         return env
 
+    @staticmethod
+    def _scan_env(path, prefix=''):
+        """ Names, paths and modification times of env files. Files in subfolders are named as in memory storage. """
+        if not os.path.isdir(path):
+            return
+        with os.scandir(path) as entries:
+            entries = [entry for entry in entries if not entry.name.startswith('.')]
+        for entry in entries:
+            name = os.path.join(prefix, os.path.splitext(entry.name)[0])
+            if entry.is_dir():
+                yield from LocalResearchStorage._scan_env(entry.path, prefix=name)
+            else:
+                yield name, entry.path, entry.stat().st_mtime_ns
+
     @classmethod
     def remove(cls, name, ask=True, force=False):
         """ Remove research folder.
@@ -46,6 +46,40 @@ def deserialize(file, ignore=None, **kwargs):
     """ Unpickle an object from a file. Attributed that can't be loaded will be changed by str. """
     return Unpickler(file, ignore=ignore, **kwargs).load()
 
+def serialize_records(values, file):
+    """ Pickle dict items into a file as a sequence of `(key, pickled value)` records.
+    Values are pickled separately, so that :func:`~.deserialize_records` can skip them without unpickling. """
+    for key, value in values.items():
+        dill.dump((key, dill.dumps(value)), file)
+
+def deserialize_records(file, keys=None):
+    """ Iterate over `(key, value)` pairs of a file, created by :func:`~.serialize_records`,
+    unpickling only values for `keys` (all, if None). Files with one pickled dict are also supported.
+    Keys are expected to be sorted, so reading stops after the last of `keys`. """
+    unpickler = Unpickler(file)
+    try:
+        record = unpickler.load()
+    except EOFError:
+        return
+
+    if isinstance(record, dict):
+        for key, value in record.items():
+            if keys is None or key in keys:
+                yield key, value
+        return
+
+    last_key = None if keys is None else max(keys, default=None)
+    while True:
+        key, value = record
+        if keys is not None and (last_key is None or key > last_key):
+            return
+        if keys is None or key in keys:
+            yield key, deserialize(io.BytesIO(value))
+        try:
+            record = unpickler.load()
+        except EOFError:
+            return
+
 def count_startswith(seq, name):
     return sum(1 for item in seq if item.startswith(name))
 
@@ -1,10 +1,7 @@
 # pylint: disable=redefined-outer-name, missing-docstring
-import sys
-
 import pytest
 import numpy as np
 
-sys.path.append('..')
 from batchflow import Dataset, Batch, apply_parallel, B
 
 
@@ -85,7 +85,7 @@ def test_split_correctness(index):
     Constants in 'shares' are such that test does not raise errors.
     """
     index, _ = index
-    shares = .3 - np.random.random(3) *.05
+    shares = .3 - make_rng(13).random(3) * .05
     index.split(shares=shares)
 
     assert set(index.index) == (set(index.train.index)
@@ -109,35 +109,28 @@ def test_get_pos_iterable(index):
     assert (index.get_pos(elem) == np.arange(len(values))).all()
 
 
-def test_shuffle_bool_false(index):
-    index, values = index
-    right = np.arange(len(values))
-    left = index.shuffle(shuffle=False)
-    assert (left == right).all()
-
-def test_shuffle_bool_true(index):
+@pytest.mark.parametrize('shuffle, permuted', [(False, False), (42, True), (13, None), ('random_state', None)])
+def test_shuffle(index, shuffle, permuted):
+    """ Shuffled positions are a permutation, which is reproduced by the same seed.
+    'permuted' tells whether the order must (True) or must not (False) differ from the sequential one.
+    """
     index, values = index
     right = np.arange(len(values))
-    left = index.shuffle(shuffle=42)
-    assert (left != right).any()
+    # RandomState is stateful, so a fresh one is made for each call
+    make_seed = (lambda: np.random.RandomState(13)) if shuffle == 'random_state' else (lambda: shuffle)
+    left = index.shuffle(shuffle=make_seed())
 
-def test_shuffle_int(index):
-    index, values = index
-    right = make_rng(13).permutation(np.arange(len(values)))
-    left = index.shuffle(shuffle=13)
-    assert (left == right).all()
-
-def test_shuffle_randomstate(index):
-    index, values = index
-    right = make_rng(np.random.RandomState(13)).permutation(np.arange(len(values)))
-    left = index.shuffle(shuffle=np.random.RandomState(13))
-    assert (left == right).all()
+    assert np.array_equal(np.sort(left), right)
+    if shuffle is not False:
+        assert (left == make_rng(make_seed()).permutation(right)).all()
+    if permuted is not None:
+        assert (left != right).any() == permuted
 
 def test_create_batch_pos_true(index):
     """ When 'pos' is True, method creates new batch by specified positions. """
     index, values = index
     right = values[:5]
-    left = index.create_batch(range(5), pos=True).index
+    left = index.create_batch(np.arange(5), pos=True).index
     assert (left == right).all()
 
 def test_create_batch_pos_false_str(index):
@@ -188,9 +181,11 @@ def test_next_batch_drop_last_false_2(index):
 def test_next_batch_drop_last_true(index):
     """ Order and contents of generated batches is same at every epoch.
     'shuffle' is False, so dropped indices are always the same.
+    Each pair of batches ends with an epoch boundary, so three pairs cover three epochs:
+    without the wrap, the first batch of a later pair would contain the last item.
     """
     index, _ = index
-    for _ in range(10):
+    for _ in range(3):
         batch_1 = index.next_batch(batch_size=2,
                                    n_epochs=None,
                                    drop_last=True,
@@ -203,13 +198,20 @@ def test_next_batch_drop_last_true(index):
         assert (batch_2.index == index.index[2:4]).all()
 
 def test_next_batch_smaller(index):
-    """ 'batch_size' is twice as small as length DatasetIndex. """
+    """ 'batch_size' is twice as small as length DatasetIndex.
+    Four batches are enough to cross the epoch boundary, where the last item is dropped.
+    """
     index, _ = index
-    for _ in range(10):
+    batches = []
+    for _ in range(4):
         batch = index.next_batch(batch_size=2,
                                  n_epochs=None,
                                  drop_last=True)
         assert len(batch) == 2
+        batches.append(batch.index)
+    # The last item is dropped at the end of the first epoch, and the second one starts from the beginning
+    assert (np.concatenate(batches[2:]) == np.concatenate(batches[:2])).all()
+    assert index.index[-1] not in np.concatenate(batches)
 
 def test_next_batch_bigger(index):
     """ When 'batch_size' is bigger than DatasetIndex's length, ValueError is raised
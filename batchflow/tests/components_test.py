@@ -1,10 +1,8 @@
 # pylint: disable=missing-docstring, redefined-outer-name, import-error, no-name-in-module
-import sys
 import pytest
 import numpy as np
 import pandas as pd
 
-sys.path.append('../..')
 from batchflow.components import create_item_class
 from batchflow.utils import is_iterable
 
@@ -2,11 +2,8 @@
 Each function tests specific Config class method.
 """
 
-import sys
 import pytest
 
-sys.path.append('../..')
-
 from batchflow import Config
 
 def test_dict_init():
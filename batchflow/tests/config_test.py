@@ -1,8 +1,6 @@
 # pylint: disable=redefined-outer-name, missing-docstring
-import sys
 import pytest
 
-sys.path.append('..')
 from batchflow import Config
 
 
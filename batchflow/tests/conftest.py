@@ -1,5 +1,11 @@
 """ Pytest configuration. """
-# pylint: disable=invalid-name, unused-import
+# pylint: disable=invalid-name, unused-import, wrong-import-position
+import os
+import sys
+
+# Make the repository root importable once for the whole session, independent of the working directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
 import pytest
 import numpy as np
 
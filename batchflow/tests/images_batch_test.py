@@ -0,0 +1,65 @@
+""" Test ImagesBatch transforms """
+# pylint: disable=redefined-outer-name
+import pytest
+import numpy as np
+
+from batchflow import ImagesBatch, DatasetIndex
+from batchflow import batch_image
+
+
+BATCH_SIZE = 4
+IMAGE_SHAPE = 8, 6, 3
+
+
+def make_batch(dtype):
+    """ Create a batch of random images of a given dtype """
+    rng = np.random.default_rng(42)
+    if np.dtype(dtype) == np.uint8:
+        images = rng.integers(0, 256, size=(BATCH_SIZE, *IMAGE_SHAPE)).astype(dtype)
+    else:
+        images = rng.random((BATCH_SIZE, *IMAGE_SHAPE)).astype(dtype)
+    labels = np.zeros(BATCH_SIZE)
+    return ImagesBatch(DatasetIndex(BATCH_SIZE), preloaded=(images, labels))
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.float16, np.float32, np.float64])
+@pytest.mark.parametrize('clip', [True, False])
+@pytest.mark.parametrize('preserve_type', [True, False])
+@pytest.mark.parametrize('action, kwargs', [('multiply', dict(multiplier=1.7)),
+                                            ('add', dict(term=.3)),
+                                            ('add', dict(term=50))])
+def test_affine_transforms(monkeypatch, dtype, clip, preserve_type, action, kwargs):
+    """ test that `multiply` and `add` give the same results with and without `affine_clip` kernel """
+    pytest.importorskip('numba')
+    if dtype == np.uint8 and preserve_type and not clip:
+        pytest.skip('Overflowing casts to `np.uint8` are not defined')
+    kwargs = dict(kwargs, clip=clip, preserve_type=preserve_type)
+
+    fused = np.stack(getattr(make_batch(dtype), action)(**kwargs).images)
+    monkeypatch.setattr(batch_image, 'NUMBA_AVAILABLE', False)
+    expected = np.stack(getattr(make_batch(dtype), action)(**kwargs).images)
+
+    assert fused.dtype == expected.dtype
+    # Truncation to integers may differ by one due to the precision of intermediate results
+    atol = 1 if fused.dtype == np.uint8 else 1e-3
+    assert np.allclose(fused.astype(np.float64), expected.astype(np.float64), atol=atol)
+
+
+@pytest.mark.parametrize('p_noise', [0., .01, .3, .7, 1.])
+def test_sample_salt(p_noise):
+    """ test that salt positions are distinct and their number is distributed as Binomial(n_pixels, p_noise) """
+    np.random.seed(42)
+    shape = 20, 30
+    n_pixels, n_draws = shape[0] * shape[1], 500
+
+    counts = []
+    for _ in range(n_draws):
+        rows, cols = ImagesBatch._sample_salt(shape, p_noise) # pylint: disable=protected-access
+        positions = rows * shape[1] + cols
+        assert ((rows >= 0) & (rows < shape[0]) & (cols >= 0) & (cols < shape[1])).all()
+        assert np.unique(positions).size == positions.size
+        counts.append(positions.size)
+
+    mean, std = n_pixels * p_noise, np.sqrt(n_pixels * p_noise * (1 - p_noise))
+    assert abs(np.mean(counts) - mean) <= 4 * std / np.sqrt(n_draws)
+    assert abs(np.std(counts) - std) <= .2 * std
@@ -1,12 +1,10 @@
 # pylint: disable=redefined-outer-name, missing-docstring
-import sys
 from contextlib import ExitStack as does_not_raise
 
 import pytest
 import numpy as np
 import pandas as pd
 
-sys.path.append('..')
 from batchflow import (B, L, C, D, F, V, R, P, PP, I, Dataset, Pipeline, Batch,
                        apply_parallel)
 
@@ -1,12 +1,14 @@
 """ Tests for Research and correspong classes. """
 # pylint: disable=no-name-in-module, missing-docstring, redefined-outer-name
 import os
+import io
 import sys
 import glob
 from contextlib import ExitStack as does_not_raise
 import pytest
 import psutil
 
+import dill
 import numpy as np
 
 from batchflow import Dataset, Pipeline, B, V, C
@@ -14,6 +16,7 @@ from batchflow import NumpySampler as NS
 from batchflow.models.torch import ResNet
 from batchflow.opensets import CIFAR10
 from batchflow.research import Experiment, Executor, Domain, Option, Research, E, EC, O, S, ResearchResults, Alias
+from batchflow.research.utils import serialize_records, deserialize_records
 
 class Model:
     def __init__(self):
@@ -673,5 +676,52 @@ class TestResults:
 
         assert len(df) == 1
 
+    @pytest.mark.parametrize('dump_results', [False, True])
+    def test_wide_table(self, dump_results, tmp_path):
+        def each(x):
+            return x
+
+        def last(x):
+            return -x
+
+        # Names are saved at different iterations, so that wide table has gaps
+        research = (Research(name=os.path.join(tmp_path, 'research'), domain=Domain(x=[1, 2]))
+            .add_callable('each', each, x=EC('x'), save_to='each')
+            .add_callable('last', last, x=EC('x'), save_to='last', when='last')
+        )
+        research.run(n_iters=3, parallel=False, dump_results=dump_results)
+
+        wide = research.results.to_df(pivot=True, include_config=False)
+        long = research.results.to_df(pivot=False, include_config=False)
+        expected = long.set_index(['id', 'iteration', 'name'])['value'].unstack().astype(float)
+
+        assert len(wide) == 6
+        assert wide['last'].notna().sum() == 2
+        wide = wide.set_index(['id', 'iteration'])[expected.columns].astype(float)
+        assert wide.sort_index().equals(expected.sort_index())
+
+class TestRecords:
+    VALUES = {0: np.arange(3), 2: 'a', 5: {'b': [1, 2]}, 7: None}
+
+    @pytest.mark.parametrize('keys', [None, [2, 5], [0], [7, 10], [1, 3], []])
+    @pytest.mark.parametrize('legacy', [False, True])
+    def test_round_trip(self, keys, legacy):
+        file = io.BytesIO()
+        if legacy:
+            # Files with one pickled dict, dumped by previous versions
+            dill.dump(self.VALUES, file)
+        else:
+            serialize_records(self.VALUES, file)
+        file.seek(0)
+
+        loaded = dict(deserialize_records(file, keys=keys))
+        expected = {key: value for key, value in self.VALUES.items() if keys is None or key in keys}
+
+        assert list(loaded) == list(expected)
+        assert repr(loaded) == repr(expected)
+
+    def test_empty_file(self):
+        assert list(deserialize_records(io.BytesIO())) == []
+
 # #TODO: test that exceptions in one branch don't affect other bracnhes,
 # #      devices splitting, ...
@@ -3,11 +3,8 @@
 Test save_to function
 """
 
-import sys
-
 import numpy as np
 
-sys.path.append('../..')
 from batchflow import Config, Pipeline, C, save_data_to
 
 
@@ -1,4 +1,5 @@
 """ Test torch layers """
+import copy
 from contextlib import nullcontext
 # pylint: disable=import-error, no-name-in-module
 import pytest
@@ -8,6 +9,9 @@ import numpy as np
 
 from batchflow.models.torch.layers.pooling import GlobalMaxPool, GlobalAvgPool, MaxPool, AvgPool
 from batchflow.models.torch.layers.core import Flatten
+from batchflow.models.torch.layers.hamburger import Hamburger
+from batchflow.models.torch.blocks.pyramid import PyramidPooling, ASPP
+from batchflow.models.torch.blocks.attention import SimpleSelfAttention, FPA
 
 # POOLING_TEST_DATA format: (input array,
 #                    resulting array,
@@ -111,3 +115,158 @@ def test_flatten_default(inp_shape):
 
     assert out.ndim == 2
     assert out.shape == (inp.shape[0], np.prod(inp_shape))
+
+
+@pytest.mark.parametrize('S', [1, 2])
+@pytest.mark.parametrize('rand_init', [True, False])
+def test_hamburger(S, rand_init):
+    """ test Hamburger output shape and that stored bases are not changed by forward """
+    inp = torch.rand(3, 8, 5, 4)
+    layer = Hamburger(inputs=inp, S=S, R=4, rand_init=rand_init)
+
+    out = layer(inp)
+    assert out.shape == inp.shape
+
+    if not rand_init:
+        bases = layer.bases.clone()
+        layer(inp)
+        assert torch.equal(layer.bases, bases)
+
+@pytest.mark.skipif(not hasattr(torch, 'compile'), reason='Compilation requires torch>=2.0')
+def test_hamburger_compile():
+    """ test that Hamburger with compiled MD step gives the same outputs as the eager one """
+    inp = torch.rand(2, 8, 5, 4)
+    layer = Hamburger(inputs=inp, R=4, rand_init=False)
+    # Default mode is used instead of 'max-autotune' to keep compilation fast
+    compiled = Hamburger(inputs=inp, R=4, rand_init=False, use_compile={'mode': None})
+
+    # Bases are created at the first call, so they are the same for the same seed
+    torch.manual_seed(0)
+    out = layer(inp)
+    torch.manual_seed(0)
+    compiled_out = compiled(inp)
+    assert torch.allclose(compiled_out, out, atol=1e-4)
+
+@pytest.mark.parametrize('autocast_dtype', [None, torch.bfloat16])
+def test_hamburger_outer_autocast(autocast_dtype):
+    """ test that Hamburger works inside an outer autocast region, e.g. the one of model's `amp` """
+    inp = torch.rand(2, 8, 5, 4)
+    layer = Hamburger(inputs=inp, R=4, rand_init=False, autocast_dtype=autocast_dtype)
+    layer(inp)
+
+    with torch.autocast(device_type='cpu', dtype=torch.bfloat16):
+        out = layer(inp)
+    assert out.shape == inp.shape
+    assert out.dtype == inp.dtype
+    assert torch.isfinite(out).all()
+
+
+@pytest.mark.parametrize('shape', [(16, 16), (12, 12)])
+def test_pyramid_pooling_input_shape(shape):
+    """ test that PyramidPooling concatenates branches in the same way as `Combine` for inputs of other shapes """
+    module = PyramidPooling(inputs=torch.rand(2, 4, 16, 16), channels=2, pyramid=(0, 1, 2, 4)).eval()
+    inp = torch.rand(2, 4, *shape)
+
+    with torch.no_grad():
+        out = module(inp)
+        expected = module.combine([layer(inp) for layer in module.blocks])
+    assert out.shape == (2, module.num_channels, *shape)
+    assert torch.allclose(out, expected)
+
+
+@pytest.mark.parametrize('shape', [(12, 12), (16, 16)])
+def test_aspp_input_shape(shape):
+    """ test that ASPP concatenates branches in the same way as `Combine` for inputs of other shapes """
+    module = ASPP(inputs=torch.rand(2, 4, 12, 12), channels=2, rates=(1, 2)).eval()
+    inp = torch.rand(2, 4, *shape)
+
+    with torch.no_grad():
+        out = module(inp)
+        expected = module.combine([layer(inp) for layer in module.blocks])
+    assert out.shape == expected.shape
+    assert torch.allclose(out, expected)
+
+
+def test_simple_self_attention_legacy_state_dict():
+    """ test that SimpleSelfAttention loads weights of separate branches, saved by previous versions """
+    inp = torch.rand(2, 16, 6, 6)
+    module = SimpleSelfAttention(inputs=inp, ratio=4).eval()
+    with torch.no_grad():
+        module.gamma.fill_(1.)
+
+    legacy_state_dict = {}
+    for key, value in module.state_dict().items():
+        if not key.startswith('branches.'):
+            legacy_state_dict[key] = value
+            continue
+        suffix = key[len('branches.'):]
+        values = [value] * 3 if value.ndim == 0 else torch.split(value, module.split_sizes)
+        for branch, branch_value in zip(SimpleSelfAttention.LEGACY_BRANCHES, values):
+            legacy_state_dict[f'{branch}.{suffix}'] = branch_value.clone()
+
+    loaded = SimpleSelfAttention(inputs=inp, ratio=4).eval()
+    loaded.load_state_dict(legacy_state_dict)
+
+    with torch.no_grad():
+        assert torch.allclose(loaded(inp), module(inp))
+
+
+def test_simple_self_attention_int8():
+    """ test that quantized SimpleSelfAttention is close to the original one """
+    inp = torch.rand(2, 16, 6, 6)
+    module = SimpleSelfAttention(inputs=inp, ratio=4).eval()
+    with torch.no_grad():
+        module.gamma.fill_(1.)
+
+    quantized = copy.deepcopy(module).to_int8()
+    with torch.no_grad():
+        expected, out = module(inp), quantized(inp)
+    assert torch.allclose(out, expected, atol=0.05 * expected.abs().max().item())
+
+
+def test_simple_self_attention_train_after_eval():
+    """ test that inference of SimpleSelfAttention doesn't change the module """
+    inp = torch.rand(2, 16, 6, 6)
+    module = SimpleSelfAttention(inputs=inp, ratio=4)
+    modules, keys = [type(item) for item in module.modules()], list(module.state_dict())
+
+    module.eval()
+    with torch.no_grad():
+        module(inp)
+    module.train()
+
+    assert [type(item) for item in module.modules()] == modules
+    assert list(module.state_dict()) == keys
+    module(inp).sum().backward()
+    assert all(parameter.grad is not None for parameter in module.parameters())
+
+
+@pytest.mark.skipif(not hasattr(torch.nn.Module, 'compile'), reason='Module compilation requires torch>=2.2')
+def test_fpa_compile():
+    """ test that compiled FPA gives the same outputs as the eager one """
+    inp = torch.rand(2, 8, 16, 16)
+    module = FPA(inputs=inp).eval()
+    compiled = FPA(inputs=inp, use_compile={'backend': 'eager'}).eval()
+    compiled.load_state_dict(module.state_dict())
+
+    with torch.no_grad():
+        assert torch.allclose(compiled(inp), module(inp), atol=1e-5)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='CUDA graphs require a CUDA device')
+def test_pyramid_pooling_cuda_graph():
+    """ test that PyramidPooling replays CUDA graph with eager outputs and captures it again for new shapes """
+    inp = torch.rand(2, 4, 16, 16, device='cuda')
+    module = PyramidPooling(inputs=inp, channels=2, pyramid=(0, 1, 2, 4), cuda_graph=True).cuda().eval()
+
+    with torch.no_grad():
+        assert torch.allclose(module(inp), module.eager_forward(inp))
+        graph = module.graph
+
+        other = torch.rand(2, 4, 16, 16, device='cuda')
+        assert torch.allclose(module(other), module.eager_forward(other))
+        assert module.graph is graph
+
+        other = torch.rand(3, 4, 12, 12, device='cuda')
+        assert torch.allclose(module(other), module.eager_forward(other))
+        assert module.graph is not graph
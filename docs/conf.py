@@ -17,10 +17,10 @@
 # add these directories to sys.path here. If the directory is relative to the
 # documentation root, use os.path.abspath to make it absolute, like shown here.
 #
-# import os
+import os
+import re
 import sys
 sys.path.append("..")
-import batchflow
 
 
 extensions = [
@@ -51,7 +51,9 @@ copyright = '2017-2021, ' + author
 
 
 # The full version, including alpha/beta/rc tags.
-release = batchflow.__version__
+# Version is parsed from the sources, the same way as in setup.py, so that the package is not imported here
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'batchflow', '__init__.py'), 'r') as f:
+    release = re.search(r'^__version__\s*=\s*[\'"]([^\'"]*)[\'"]', f.read(), re.MULTILINE).group(1)
 # The short X.Y version.
 version = '.'.join(release.split('.')[:2])
 
@@ -41,7 +41,7 @@ setup(
     ],
     extras_require={
         'nn': [
-            'torch>=1.7',
+            'torch>=1.10',
             'einops>=0.3'
         ],
     },